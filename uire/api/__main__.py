@@ -0,0 +1,43 @@
+"""Run the UIRE API under uvicorn with the fastest available event loop.
+
+Usage:
+
+    python -m uire.api
+
+Prefers the io_uring based ``uringcore`` loop when it is installed (Linux
+5.11+), then ``uvloop``, and falls back to the stock asyncio loop.  Host
+and port come from ``UIRE_HOST`` and ``UIRE_PORT``.
+"""
+from __future__ import annotations
+import asyncio
+import os
+
+import uvicorn
+
+def install_event_loop() -> str:
+    """Install the fastest available event loop policy and return its name."""
+    try:
+        import uringcore
+        asyncio.set_event_loop_policy(uringcore.EventLoopPolicy())
+        return "uringcore"
+    except ImportError:
+        pass
+    try:
+        import uvloop
+        uvloop.install()
+        return "uvloop"
+    except ImportError:
+        return "asyncio"
+
+def main() -> None:
+    install_event_loop()
+    uvicorn.run(
+        "uire.api.main:app",
+        host=os.environ.get("UIRE_HOST", "0.0.0.0"),
+        port=int(os.environ.get("UIRE_PORT", "8000")),
+        # keep the policy installed above instead of letting uvicorn pick one
+        loop="none",
+    )
+
+if __name__ == "__main__":
+    main()
@@ -8,19 +8,26 @@ log export.  It also serves a minimal static UI for demonstration.
 """
 from __future__ import annotations
 from fastapi import FastAPI, HTTPException, Request, Header
-from fastapi.responses import JSONResponse, PlainTextResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from collections import OrderedDict
 from typing import List, Dict, Optional
+import asyncio
+import json
+import mmap
 import os
+import re
+import threading
 import time
 
-from uire.models.ambiguity_detector import AmbiguityDetector
-from uire.models.clarifier import Clarifier
+from uire.models.ambiguity_detector import AmbiguityDetector, normalize
+from uire.models.clarifier import Clarifier, MAX_QUESTIONS
 from uire.models.policy import build_intent
 from uire.utils.storage import PreferenceStore, ConsentStore, hashed_id
-from uire.utils.telemetry import log_event, inc, add_latency, stats, export_jsonl, prometheus_text
+from uire.utils.telemetry import log_event, inc, add_latency, add_process_latency, stats, export_jsonl
 
 # Configuration via environment
 APP_VERSION = os.environ.get("UIRE_VERSION", "0.5.0")
@@ -38,8 +45,11 @@ _clarifier = Clarifier()
 _store = PreferenceStore()
 _consent = ConsentStore()
 
-# Rate limiting: token bucket per client
-_buckets: Dict[str, tuple[float, float]] = {}  # client_id -> (tokens, last_timestamp)
+# Rate limiting: token bucket per client, LRU-bounded so one-off clients
+# cannot grow it forever (an evicted client simply starts with a full bucket)
+MAX_BUCKETS = 100_000
+_buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # client_id -> (tokens, last_timestamp)
+_buckets_lock = threading.Lock()
 
 # Helper to get client ID
 
@@ -51,13 +61,18 @@ def client_id(request: Request, hdr_user_id: Optional[str]) -> str:
 
 def check_rate(client: str):
     now = time.monotonic()
-    tokens, last = _buckets.get(client, (RATE_LIMIT, now))
-    elapsed = max(0.0, now - last)
-    tokens = min(RATE_LIMIT, tokens + elapsed * RATE_LIMIT)
-    if tokens < 1.0:
+    with _buckets_lock:
+        tokens, last = _buckets.get(client, (RATE_LIMIT, now))
+        elapsed = max(0.0, now - last)
+        tokens = min(RATE_LIMIT, tokens + elapsed * RATE_LIMIT)
+        limited = tokens < 1.0
+        if not limited:
+            _buckets[client] = (tokens - 1.0, now)
+            _buckets.move_to_end(client)
+            if len(_buckets) > MAX_BUCKETS:
+                _buckets.popitem(last=False)
+    if limited:
         raise HTTPException(status_code=429, detail="rate limit exceeded")
-    tokens -= 1.0
-    _buckets[client] = (tokens, now)
 
 # API key check
 
@@ -67,38 +82,42 @@ def check_api_key(request: Request):
 
 # Models
 
-class DetectRequest(BaseModel):
+class _Model(BaseModel):
+    # pydantic v2: validation and serialisation run in pydantic-core
+    model_config = ConfigDict(extra="ignore")
+
+class DetectRequest(_Model):
     query: str = Field(..., min_length=1)
 
-class DetectResponse(BaseModel):
+class DetectResponse(_Model):
     ambiguous: bool
     score: float
     factors: List[str]
 
-class ClarifyRequest(BaseModel):
+class ClarifyRequest(_Model):
     query: str
     factors: List[str] = []
 
-class QuestionOption(BaseModel):
+class QuestionOption(_Model):
     id: str
     label: str
 
-class Question(BaseModel):
+class Question(_Model):
     id: str
     question: str
     type: str = "single_choice"
     options: List[QuestionOption]
     default: str
 
-class ClarifyResponse(BaseModel):
+class ClarifyResponse(_Model):
     questions: List[Question]
     max_questions: int
 
-class ResolveRequest(BaseModel):
+class ResolveRequest(_Model):
     query: str
     answers: Dict[str, str] = {}
 
-class IntentModel(BaseModel):
+class IntentModel(_Model):
     task_type: str
     criteria: Optional[str] = None
     region: Optional[str] = None
@@ -107,14 +126,29 @@ class IntentModel(BaseModel):
     language: Optional[str] = None
     risk: str
 
-class ResolveResponse(BaseModel):
+class ResolveResponse(_Model):
     intent: IntentModel
     final_prompt: str
 
-class MemorySetRequest(BaseModel):
+class ProcessRequest(_Model):
+    query: str = Field(..., min_length=1)
+    answers: Dict[str, str] = {}
+
+class ProcessResponse(_Model):
+    ambiguous: bool
+    score: float
+    factors: List[str]
+    # Set when clarification is needed ...
+    questions: Optional[List[Question]] = None
+    max_questions: Optional[int] = None
+    # ... otherwise the resolved intent
+    intent: Optional[IntentModel] = None
+    final_prompt: Optional[str] = None
+
+class MemorySetRequest(_Model):
     prefs: Dict[str, str] = {}
 
-class ConsentRequest(BaseModel):
+class ConsentRequest(_Model):
     accepted: bool
 
 # Health check
@@ -122,6 +156,12 @@ class ConsentRequest(BaseModel):
 def health():
     return {"status": "ok", "version": APP_VERSION}
 
+# Endpoints that touch SQLite, wait on the log writer or loop over the bench
+# set are plain `def`, so FastAPI runs them in its threadpool instead of
+# blocking the event loop.  Detection is microseconds for typical queries,
+# so it stays on the loop and only unusually long queries are offloaded.
+OFFLOAD_CHARS = int(os.environ.get("UIRE_OFFLOAD_CHARS", "2000"))
+
 # Detect endpoint
 @app.post("/v1/detect", response_model=DetectResponse)
 async def detect(req: DetectRequest, request: Request, x_user_id: Optional[str] = Header(default=None)):
@@ -130,7 +170,10 @@ async def detect(req: DetectRequest, request: Request, x_user_id: Optional[str]
     check_rate(client)
     start = time.monotonic()
     inc("requests_total")
-    res = _detector.detect(req.query)
+    if len(req.query) > OFFLOAD_CHARS:
+        res = await asyncio.to_thread(_detector.detect, req.query)
+    else:
+        res = _detector.detect(req.query)
     if res["ambiguous"]:
         inc("ambiguous_total")
     dt = (time.monotonic() - start) * 1000.0
@@ -148,16 +191,11 @@ async def clarify(req: ClarifyRequest, request: Request, x_user_id: Optional[str
     if qs:
         inc("clarifications_total")
     log_event({"type": "clarify", "client": client, "query": req.query, "factors": req.factors, "questions": qs})
-    # Convert to Pydantic
-    q_models = []
-    for q in qs:
-        opts = [QuestionOption(id=o["id"], label=o["label"]) for o in q["options"]]
-        q_models.append(Question(id=q["id"], question=q["question"], type=q["type"], options=opts, default=q["default"]))
-    return {"questions": q_models, "max_questions": 2}
+    return {"questions": qs, "max_questions": MAX_QUESTIONS}
 
 # Resolve endpoint
 @app.post("/v1/resolve", response_model=ResolveResponse)
-async def resolve(req: ResolveRequest, request: Request, x_user_id: Optional[str] = Header(default=None)):
+def resolve(req: ResolveRequest, request: Request, x_user_id: Optional[str] = Header(default=None)):
     check_api_key(request)
     client = client_id(request, x_user_id)
     check_rate(client)
@@ -169,7 +207,7 @@ async def resolve(req: ResolveRequest, request: Request, x_user_id: Optional[str
 
 # Answer endpoint
 @app.post("/v1/answer")
-async def answer(req: ResolveRequest, request: Request, x_user_id: Optional[str] = Header(default=None)):
+def answer(req: ResolveRequest, request: Request, x_user_id: Optional[str] = Header(default=None)):
     check_api_key(request)
     client = client_id(request, x_user_id)
     check_rate(client)
@@ -179,23 +217,52 @@ async def answer(req: ResolveRequest, request: Request, x_user_id: Optional[str]
     log_event({"type": "answer", "client": client, "query": req.query, "answers": req.answers, "result": out})
     return out
 
+# Process endpoint: detect -> clarify -> resolve in one round-trip, sharing
+# the normalised query, the detected factors and one rate-limit check.
+# Only the fields of the branch taken are returned.
+@app.post("/v1/process", response_model=ProcessResponse, response_model_exclude_unset=True)
+def process(req: ProcessRequest, request: Request, x_user_id: Optional[str] = Header(default=None)):
+    check_api_key(request)
+    client = client_id(request, x_user_id)
+    check_rate(client)
+    start = time.monotonic()
+    inc("requests_total")
+    q = normalize(req.query)
+    res = _detector.detect_normalized(q)
+    # uire_latency_ms tracks detection only, as for /v1/detect
+    add_latency((time.monotonic() - start) * 1000.0)
+    out: Dict[str, object] = dict(res)
+    if res["ambiguous"]:
+        inc("ambiguous_total")
+    qs = _clarifier.generate(req.query, res["factors"]) if res["ambiguous"] and not req.answers else []
+    if qs:
+        inc("clarifications_total")
+        out.update(questions=qs, max_questions=MAX_QUESTIONS)
+    else:
+        prefs = _store.all_for_user(client)
+        out.update(build_intent(req.query, req.answers, defaults=prefs, q_lower=q))
+        inc("resolved_total")
+    dt = (time.monotonic() - start) * 1000.0
+    add_process_latency(dt)
+    log_event({"type": "process", "client": client, "query": req.query, "answers": req.answers, "result": out, "latency_ms": round(dt, 2)})
+    return out
+
 # Memory endpoints
 @app.get("/v1/memory")
-async def get_memory(request: Request, x_user_id: Optional[str] = Header(default=None)):
+def get_memory(request: Request, x_user_id: Optional[str] = Header(default=None)):
     check_api_key(request)
     client = client_id(request, x_user_id)
     return {"prefs": _store.all_for_user(client)}
 
 @app.post("/v1/memory")
-async def set_memory(req: MemorySetRequest, request: Request, x_user_id: Optional[str] = Header(default=None)):
+def set_memory(req: MemorySetRequest, request: Request, x_user_id: Optional[str] = Header(default=None)):
     check_api_key(request)
     client = client_id(request, x_user_id)
-    for k, v in (req.prefs or {}).items():
-        _store.set(client, k, v)
+    _store.set_many(client, req.prefs or {})
     return {"prefs": _store.all_for_user(client)}
 
 @app.delete("/v1/memory")
-async def clear_memory(request: Request, x_user_id: Optional[str] = Header(default=None)):
+def clear_memory(request: Request, x_user_id: Optional[str] = Header(default=None)):
     check_api_key(request)
     client = client_id(request, x_user_id)
     _store.clear_user(client)
@@ -203,13 +270,13 @@ async def clear_memory(request: Request, x_user_id: Optional[str] = Header(defau
 
 # Consent endpoints
 @app.get("/v1/consent")
-async def get_consent(request: Request, x_user_id: Optional[str] = Header(default=None)):
+def get_consent(request: Request, x_user_id: Optional[str] = Header(default=None)):
     check_api_key(request)
     client = client_id(request, x_user_id)
     return {"accepted": _consent.get(client)}
 
 @app.post("/v1/consent")
-async def set_consent(req: ConsentRequest, request: Request, x_user_id: Optional[str] = Header(default=None)):
+def set_consent(req: ConsentRequest, request: Request, x_user_id: Optional[str] = Header(default=None)):
     check_api_key(request)
     client = client_id(request, x_user_id)
     _consent.set(client, req.accepted)
@@ -221,33 +288,58 @@ async def get_stats():
     return stats()
 
 # Prometheus metrics
-@app.get("/metrics", response_class=PlainTextResponse)
+# Served as a plain route rather than mounting make_asgi_app(), which would
+# redirect /metrics to /metrics/
+@app.get("/metrics")
 async def metrics():
-    return prometheus_text()
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 # Export logs
 @app.get("/v1/export")
-async def export():
+def export():
     path = export_jsonl()
     return FileResponse(path, filename="events.jsonl", media_type="application/jsonl")
 
 # Bench run
+
+# Scanned over the raw JSONL buffer: one match per non-blank record line.
+# Records that open with a top-level "query" key (as generate_synthetic.py
+# writes them) take the fast path; anything else is parsed in full.
+_RECORD_RE = re.compile(rb"^[ \t]*(\S[^\n]*)", re.M)
+_LEADING_QUERY_RE = re.compile(rb'\{\s*"query"\s*:\s*"((?:[^"\\]|\\.)*)"\s*[,}]')
+
+def _record_query(line: bytes) -> Optional[str]:
+    """Return a record's top-level query ("" if absent), or None if malformed."""
+    try:
+        m = _LEADING_QUERY_RE.match(line)
+        if m:
+            # The captured value is still JSON-escaped; decode it as a string
+            return json.loads(b'"' + m.group(1) + b'"')
+        rec = json.loads(line)
+    except ValueError:
+        return None
+    q = rec.get("query", "") if isinstance(rec, dict) else ""
+    return q if isinstance(q, str) else ""
+
+def _bench_queries(path: str) -> List[str]:
+    """Return one query per well-formed record of a JSONL bench file."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            lines = _RECORD_RE.findall(buf)
+    queries = (_record_query(line) for line in lines)
+    return [q for q in queries if q is not None]
+
+# The bench file never changes while the process runs, so load it once
+_BENCH_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "uire_bench.jsonl"))
+_BENCH_QUERIES = _bench_queries(_BENCH_PATH) if os.path.exists(_BENCH_PATH) else []
+
 @app.get("/v1/bench")
-async def bench():
-    data_path = os.path.join(os.path.dirname(__file__), "..", "data", "uire_bench.jsonl")
-    data_path = os.path.abspath(data_path)
-    total = 0
-    flagged = 0
-    if os.path.exists(data_path):
-        import json
-        with open(data_path, "r", encoding="utf-8") as f:
-            for line in f:
-                total += 1
-                rec = json.loads(line)
-                q = rec.get("query", "")
-                res = _detector.detect(q)
-                if res.get("ambiguous"):
-                    flagged += 1
+def bench():
+    total = len(_BENCH_QUERIES)
+    # Records without a query are scored as empty queries, which always flag
+    flagged = sum(1 for q in _BENCH_QUERIES if _detector.detect(q)["ambiguous"])
     return {"total": total, "flagged": flagged, "flag_rate": round(flagged / (total or 1), 3)}
 
 # Serve static UI
@@ -2,11 +2,15 @@
 
 This module implements simple keyword-based heuristics to detect when a
 natural language query is underspecified.  It can be replaced with a
-trained model if desired.
+trained model if desired.  If the optional ``hyperscan`` package is
+installed the patterns are matched with a single multi-pattern scan.
 """
 from __future__ import annotations
-from typing import Dict, List
+from typing import Callable, Dict, List, Set, Tuple
+import functools
+import os
 import re
+import threading
 
 # Some generic vague terms suggesting missing criteria
 VAGUE_TERMS = {"best", "cheapest", "fastest", "quickest", "ideal", "perfect"}
@@ -17,36 +21,125 @@ PRONOUNS = {"this", "that", "these", "those", "it", "they"}
 # Regions that are commonly specified
 REGIONS = {"india", "us", "usa", "europe", "eu", "uk", "canada"}
 
+# Precompiled patterns; the keyword sets above are fused into single
+# alternations so each check is one scan of the query.
+def _alternation(words) -> re.Pattern:
+    return re.compile(r"\b(?:" + "|".join(sorted(words)) + r")\b")
+
+_VAGUE_RE = _alternation(VAGUE_TERMS)
+_PRONOUN_RE = _alternation(PRONOUNS)
+_REGION_RE = _alternation(REGIONS)
+_REFERENT_RE = re.compile(r"\b(?:file|document|text|paragraph|image|content|paper)\b")
+_SUMMARY_RE = re.compile(r"\bsummar(?:ize|ise|y)\b")
+_AUDIENCE_RE = re.compile(r"for\s+(?:kids|children|adults|experts|beginners)")
+_LENGTH_RE = re.compile(r"\b(?:short|brief|medium|long|~?\d+ words?)\b")
+_TRANSLATE_RE = re.compile(r"translate")
+_TRANSLATE_TARGET_RE = re.compile(r"to\s+[a-z]+|into\s+[a-z]+")
+_RECOMMEND_RE = re.compile(r"\b(?:recommend|best|suggest)\b")
+
+_PATTERNS: Dict[str, re.Pattern] = {
+    "vague": _VAGUE_RE,
+    "pronoun": _PRONOUN_RE,
+    "referent": _REFERENT_RE,
+    "summary": _SUMMARY_RE,
+    "audience": _AUDIENCE_RE,
+    "length": _LENGTH_RE,
+    "translate": _TRANSLATE_RE,
+    "translate_target": _TRANSLATE_TARGET_RE,
+    "recommend": _RECOMMEND_RE,
+    "region": _REGION_RE,
+}
+
+# When hyperscan is available (Linux/x86), all patterns are compiled into one
+# database and matched in a single pass; set UIRE_HYPERSCAN=0 to disable.
+try:
+    import hyperscan
+except ImportError:  # hyperscan is optional
+    hyperscan = None
+
+_HS_NAMES = list(_PATTERNS)
+_hs_db = None
+if hyperscan is not None and os.environ.get("UIRE_HYPERSCAN", "1") != "0":
+    _hs_db = hyperscan.Database()
+    _hs_db.compile(
+        expressions=[_PATTERNS[n].pattern.encode() for n in _HS_NAMES],
+        ids=list(range(len(_HS_NAMES))),
+        elements=len(_HS_NAMES),
+        flags=hyperscan.HS_FLAG_SINGLEMATCH,
+    )
+    # Scratch space may not be shared between concurrent scans
+    _hs_local = threading.local()
+
+def _on_match(pid, start, end, flags, matched) -> None:
+    matched.add(_HS_NAMES[pid])
+
+def _re_matcher(q: str) -> Callable[[str], bool]:
+    return lambda name: _PATTERNS[name].search(q) is not None
+
+def _matcher(q: str) -> Callable[[str], bool]:
+    """Return a predicate telling whether the named pattern matches q."""
+    # hyperscan applies ASCII semantics to \b, \d and \s, while re uses
+    # Unicode ones; they only agree on printable ASCII, so anything else
+    # (accented letters, other digits, control characters) goes to re
+    if _hs_db is None or not (q.isascii() and q.isprintable()):
+        return _re_matcher(q)
+    scratch = getattr(_hs_local, "scratch", None)
+    if scratch is None:
+        scratch = _hs_local.scratch = hyperscan.Scratch(_hs_db)
+    matched: Set[str] = set()
+    _hs_db.scan(q.encode(), match_event_handler=_on_match, context=matched, scratch=scratch)
+    return matched.__contains__
+
+def _detect(q: str) -> Tuple[bool, float, Tuple[str, ...]]:
+    """Score a normalised query; results are immutable so they can be cached."""
+    if not q:
+        return True, 1.0, ("empty_query",)
+    has = _matcher(q)
+    factors: List[str] = []
+
+    # Criteria missing if vague term present
+    if has("vague"):
+        factors.append("criteria_missing")
+
+    # Referent missing if pronoun appears without a file/text/object mention
+    if has("pronoun") and not has("referent"):
+        factors.append("referent_missing")
+
+    # Summarisation tasks often need audience and length
+    if has("summary"):
+        if not has("audience"):
+            factors.append("audience_missing")
+        if not has("length"):
+            factors.append("length_missing")
+
+    # Translation tasks need a target language
+    if has("translate") and not has("translate_target"):
+        factors.append("language_missing")
+
+    # Recommendations often need region
+    if has("recommend") and not has("region"):
+        factors.append("region_missing")
+
+    # Each branch appends at most once, so factors are already unique
+    ambiguous = bool(factors)
+    score = min(1.0, 0.3 + 0.2 * len(factors)) if ambiguous else 0.0
+    return ambiguous, round(score, 2), tuple(factors)
+
+# Memoised for repeat queries; longer queries bypass the cache so that 4096
+# entries stay small no matter how large the request bodies are
+CACHE_MAX_CHARS = 2000
+_detect_cached = functools.lru_cache(maxsize=4096)(_detect)
+
+def normalize(query: str) -> str:
+    """Normalise a query the way the detector sees it (stripped, lower-cased)."""
+    return (query or "").strip().lower()
+
 class AmbiguityDetector:
     def detect(self, query: str) -> Dict[str, object]:
-        q = (query or "").strip().lower()
-        factors: List[str] = []
-        if not q:
-            return {"ambiguous": True, "score": 1.0, "factors": ["empty_query"]}
-
-        # Criteria missing if vague term present
-        if any(term in q for term in VAGUE_TERMS):
-            factors.append("criteria_missing")
-
-        # Referent missing if pronoun appears without a file/text/object mention
-        if any(re.search(rf"\b{p}\b", q) for p in PRONOUNS) and not re.search(r"\b(file|document|text|paragraph|image|content|paper)\b", q):
-            factors.append("referent_missing")
-
-        # Summarisation tasks often need audience and length
-        if re.search(r"\bsummar(ize|ise|y)\b", q):
-            if not re.search(r"for\s+(kids|children|adults|experts|beginners)", q):
-                factors.append("audience_missing")
-            if not re.search(r"\b(short|brief|medium|long|~?\d+ words?)\b", q):
-                factors.append("length_missing")
-
-        # Translation tasks need a target language
-        if "translate" in q and not re.search(r"to\s+[a-z]+|into\s+[a-z]+", q):
-            factors.append("language_missing")
-
-        # Recommendations often need region
-        if re.search(r"\b(recommend|best|suggest)\b", q) and not any(r in q for r in REGIONS):
-            factors.append("region_missing")
-
-        ambiguous = bool(factors)
-        score = min(1.0, 0.3 + 0.2 * len(factors)) if ambiguous else 0.0
-        return {"ambiguous": ambiguous, "score": round(score, 2), "factors": list(dict.fromkeys(factors))}
+        return self.detect_normalized(normalize(query))
+
+    def detect_normalized(self, q: str) -> Dict[str, object]:
+        """Like detect() for a query that has already been through normalize()."""
+        score_fn = _detect_cached if len(q) <= CACHE_MAX_CHARS else _detect
+        ambiguous, score, factors = score_fn(q)
+        return {"ambiguous": ambiguous, "score": score, "factors": list(factors)}
@@ -9,29 +9,49 @@ from __future__ import annotations
 from typing import Dict, Optional
 import re
 
-# Simple task inference
+# Summarize and recommend keywords in one pattern; each alternative is a
+# named group so one scan reports both.  "translate" is checked separately
+# because finditer does not report overlapping matches and a recommend
+# keyword could otherwise swallow its leading "t" ("bestranslate").
+_TASK_RE = re.compile(r"(?P<summarize>\bsummar(?:ize|ise|y)\b)|(?P<recommend>best|recommend|suggest)")
 
-def infer_task(query: str) -> str:
-    q = query.lower()
+# Risk tier inference based on domain keywords
+HIGH_RISK_KEYWORDS = {"medical", "finance", "legal"}
+_RISK_RE = re.compile("|".join(sorted(HIGH_RISK_KEYWORDS)))
+
+_REGION_MAP = {"IN": "IN", "INDIA": "IN", "US": "US", "USA": "US", "EU": "EU", "EUROPE": "EU"}
+_LENGTH_WORDS = {"short": "~150", "medium": "~300", "long": "~600"}
+_CRITERIA_LABELS = {"fees": "lowest fees", "speed": "fast process", "trust": "high trust/brand"}
+
+def _infer_task(q: str) -> str:
+    """infer_task for an already lower-cased query."""
     if "translate" in q:
         return "translate"
-    if re.search(r"\bsummar(ize|ise|y)\b", q):
-        return "summarize"
-    if any(k in q for k in ["best", "recommend", "suggest"]):
-        return "recommend"
-    return "general"
+    found = "general"
+    for m in _TASK_RE.finditer(q):
+        if m.lastgroup == "summarize":
+            return "summarize"
+        found = "recommend"
+    return found
 
-# Risk tier inference based on domain keywords
-HIGH_RISK_KEYWORDS = {"medical", "finance", "legal"}
+def _risk_tier(q: str) -> str:
+    """risk_tier for an already lower-cased query."""
+    return "high" if _RISK_RE.search(q) else "low"
+
+# Simple task inference
+
+def infer_task(query: str) -> str:
+    return _infer_task(query.lower())
 
 def risk_tier(query: str) -> str:
-    q = query.lower()
-    return "high" if any(k in q for k in HIGH_RISK_KEYWORDS) else "low"
+    return _risk_tier(query.lower())
 
 # Build intent dict and final prompt
 
-def build_intent(query: str, answers: Dict[str, str], defaults: Optional[Dict[str, str]] = None) -> Dict[str, object]:
-    t = infer_task(query)
+def build_intent(query: str, answers: Dict[str, str], defaults: Optional[Dict[str, str]] = None, q_lower: Optional[str] = None) -> Dict[str, object]:
+    # Callers that already lower-cased the query can pass it as q_lower
+    q = query.lower() if q_lower is None else q_lower
+    t = _infer_task(q)
     prefs = defaults or {}
     merged = dict(prefs)
     merged.update(answers or {})
@@ -39,12 +59,12 @@ def build_intent(query: str, answers: Dict[str, str], defaults: Optional[Dict[st
     region = merged.get("region") or merged.get("q2")
     if region:
         region = region.upper()
-        region = {"IN": "IN", "INDIA": "IN", "US": "US", "USA": "US", "EU": "EU", "EUROPE": "EU"}.get(region, region)
+        region = _REGION_MAP.get(region, region)
     criteria = merged.get("criteria") or merged.get("q1")
     audience = merged.get("audience")
     length = merged.get("length")
     language = merged.get("language") or merged.get("q3")
-    risk = risk_tier(query)
+    risk = _risk_tier(q)
     intent = {
         "task_type": t,
         "criteria": criteria,
@@ -57,13 +77,13 @@ def build_intent(query: str, answers: Dict[str, str], defaults: Optional[Dict[st
     # Compose prompt
     if t == "summarize":
         aud = audience or "simple"
-        words = {"short": "~150", "medium": "~300", "long": "~600"}.get(length or "short", "~150")
+        words = _LENGTH_WORDS.get(length or "short", "~150")
         prompt = f"Summarize the provided content for a {aud} audience in {words} words with citations."
     elif t == "translate":
         lang = (language or "EN").upper()
         prompt = f"Translate the provided text into {lang} with natural tone and preserve formatting."
     elif t == "recommend":
-        crit_label = {"fees": "lowest fees", "speed": "fast process", "trust": "high trust/brand"}.get(criteria or "fees", criteria or "fees")
+        crit_label = _CRITERIA_LABELS.get(criteria or "fees", criteria or "fees")
         loc = region or "IN"
         prompt = f"Recommend suitable options in {loc} optimised for {crit_label}. Explain trade-offs and assumptions."
     else:
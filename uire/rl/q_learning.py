@@ -3,29 +3,76 @@
 This module defines a minimal Q-learning algorithm for deciding whether
 to ask clarifying questions or assume defaults.  It is provided as a
 reference implementation and not integrated into the API.
+
+The Q-table is a dense NumPy array indexed by a per-policy state id.
+When numba is installed the update and greedy-action kernels are
+JIT-compiled (and cached on disk); otherwise they run as plain Python.
 """
 from __future__ import annotations
+import os
 import random
 from typing import Dict, Tuple
 
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+N_ACTIONS = 2  # 0 = ask clarifying question, 1 = assume default
+
+@njit(cache=True)
+def _update(q, s, a, r, sp, alpha, gamma):
+    best_next = max(q[sp, 0], q[sp, 1])
+    q[s, a] += alpha * (r + gamma * best_next - q[s, a])
+
+@njit(cache=True)
+def _greedy(q, s):
+    # Ties resolve to action 0 (ask), matching the unseen-state default
+    return 0 if q[s, 0] >= q[s, 1] else 1
+
 class QPolicy:
-    def __init__(self, alpha: float = 0.1, gamma: float = 0.9, epsilon: float = 0.2):
+    def __init__(self, alpha: float = 0.1, gamma: float = 0.9, epsilon: float = 0.2, n_states: int = 64):
         self.alpha = alpha
         self.gamma = gamma
         self.epsilon = epsilon
-        # Q-table maps state -> action -> value
-        self.q: Dict[Tuple[int], Dict[int, float]] = {}
+        # Q-table rows are state ids, columns are actions; grows on demand
+        self.q = np.zeros((max(1, n_states), N_ACTIONS), dtype=np.float32)
+        self._state_ids: Dict[Tuple[int, ...], int] = {}
+
+    def _state_id(self, state: Tuple[int, ...]) -> int:
+        sid = self._state_ids.get(state)
+        if sid is None:
+            sid = len(self._state_ids)
+            if sid >= self.q.shape[0]:
+                grown = np.zeros((self.q.shape[0] * 2, N_ACTIONS), dtype=np.float32)
+                grown[: self.q.shape[0]] = self.q
+                self.q = grown
+            self._state_ids[state] = sid
+        return sid
 
-    def choose_action(self, state: Tuple[int]) -> int:
-        # actions: 0 = ask clarifying question, 1 = assume default
+    def choose_action(self, state: Tuple[int, ...]) -> int:
         if random.random() < self.epsilon:
             return random.choice([0, 1])
-        values = self.q.get(state, {})
-        return max(values.keys(), default=0, key=lambda a: values.get(a, 0.0))
-
-    def update(self, state: Tuple[int], action: int, reward: float, next_state: Tuple[int]) -> None:
-        values = self.q.setdefault(state, {})
-        old = values.get(action, 0.0)
-        next_values = self.q.get(next_state, {})
-        best_next = max(next_values.values(), default=0.0)
-        values[action] = old + self.alpha * (reward + self.gamma * best_next - old)
+        sid = self._state_ids.get(state)
+        if sid is None:
+            return 0
+        return int(_greedy(self.q, sid))
+
+    def update(self, state: Tuple[int, ...], action: int, reward: float, next_state: Tuple[int, ...]) -> None:
+        # The numba kernel does not bounds-check, so reject bad actions here
+        if action not in (0, 1):
+            raise ValueError(f"action must be 0 or 1, got {action!r}")
+        s = self._state_id(state)
+        sp = self._state_id(next_state)
+        _update(self.q, s, action, reward, sp, self.alpha, self.gamma)
+
+# Compile the kernels at import instead of on the first training step
+if os.environ.get("UIRE_NUMBA_WARMUP"):
+    _q = np.zeros((1, N_ACTIONS), dtype=np.float32)
+    _update(_q, 0, 0, 0.0, 0, 0.1, 0.9)
+    _greedy(_q, 0)
@@ -0,0 +1,31 @@
+"""Tests for the heuristic ambiguity detector."""
+import pytest
+
+from uire.models import ambiguity_detector as ad
+
+def test_long_queries_bypass_cache():
+    ad._detect_cached.cache_clear()
+    detector = ad.AmbiguityDetector()
+    detector.detect("best bank")
+    assert ad._detect_cached.cache_info().currsize == 1
+    res = detector.detect("best " * ad.CACHE_MAX_CHARS)
+    assert res["factors"] == ["criteria_missing", "region_missing"]
+    assert ad._detect_cached.cache_info().currsize == 1
+
+def test_hyperscan_and_re_paths_agree():
+    if ad._hs_db is None:
+        pytest.skip("hyperscan is not installed")
+    queries = [
+        "best bank",
+        "besté recommend",
+        "summarize ٣ words",
+        "summarize for\x1fkids in 100 words",
+        "translate\tthis\nto hindi",
+        "recommend a phone in india",
+        "résumé: summarise this file briefly",
+        "what is ｂｅｓｔ",
+    ]
+    for q in queries:
+        has, reference = ad._matcher(q), ad._re_matcher(q)
+        for name in ad._PATTERNS:
+            assert has(name) == reference(name), (q, name)
@@ -5,8 +5,10 @@ that detection, clarification, resolution, answering, memory and
 consent all operate as expected.  They also check that the bench
 endpoint returns sensible values.
 """
+from collections import OrderedDict
 from fastapi.testclient import TestClient
-from uire.api.main import app
+from uire.api import main
+from uire.api.main import app, _bench_queries
 
 client = TestClient(app)
 
@@ -37,6 +39,17 @@ def test_detect_clarify_resolve_answer_flow():
     ans = client.post("/v1/answer", json={"query": q, "answers": answers}).json()
     assert "final_prompt" in ans
 
+def test_process_clarifies_then_resolves():
+    q = "Find me the best bank account"
+    first = client.post("/v1/process", json={"query": q}).json()
+    assert first["ambiguous"] is True
+    assert 0 < len(first["questions"]) <= 2
+    answers = {f"q{i}": qd["default"] for i, qd in enumerate(first["questions"], start=1)}
+    second = client.post("/v1/process", json={"query": q, "answers": answers}).json()
+    assert "questions" not in second
+    assert second["intent"]["task_type"] == "recommend"
+    assert "final_prompt" in second
+
 def test_memory_and_consent():
     # set a preference
     client.post("/v1/memory", json={"prefs": {"region": "US"}})
@@ -55,8 +68,33 @@ def test_bench():
     bench = client.get("/v1/bench").json()
     assert "total" in bench and "flagged" in bench and "flag_rate" in bench
 
+def test_bench_queries_top_level_only(tmp_path):
+    path = tmp_path / "bench.jsonl"
+    path.write_text(
+        '{"query": "a", "meta": {"query": "b"}}\n'
+        '{"meta": {"query": "b"}, "query": "c"}\n'
+        '{"q": "no query"}\n'
+        '\n'
+        '{"query": "bad \\x escape"}\n'
+    )
+    # one query per well-formed record; malformed records are skipped
+    assert _bench_queries(str(path)) == ["a", "c", ""]
+
 def test_stats_and_metrics():
     stats = client.get("/v1/stats").json()
     assert "requests_total" in stats
     metrics_text = client.get("/metrics").text
-    assert "uire_requests_total" in metrics_text
\ No newline at end of file
+    assert "uire_requests_total" in metrics_text
+    assert "uire_process_latency_ms_count" in metrics_text
+
+def test_rate_buckets_are_lru_bounded(monkeypatch):
+    monkeypatch.setattr(main, "MAX_BUCKETS", 3)
+    monkeypatch.setattr(main, "_buckets", OrderedDict())
+    for c in ["c0", "c1", "c2", "c3", "c4"]:
+        main.check_rate(c)
+    assert len(main._buckets) == 3
+    assert list(main._buckets) == ["c2", "c3", "c4"]
+    # a returning client moves to the back and the oldest one goes instead
+    main.check_rate("c2")
+    main.check_rate("c5")
+    assert list(main._buckets) == ["c4", "c2", "c5"]
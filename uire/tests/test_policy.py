@@ -0,0 +1,16 @@
+"""Tests for task inference in the intent policy.
+
+Task priority is translate, then summarize, then recommend, even when
+keywords run into each other.
+"""
+from uire.models.policy import infer_task
+
+def test_task_priority():
+    assert infer_task("Recommend how to translate this") == "translate"
+    assert infer_task("Best summary of the report") == "summarize"
+    assert infer_task("Suggest a phone") == "recommend"
+    assert infer_task("hello") == "general"
+
+def test_overlapping_keywords_keep_translate_first():
+    assert infer_task("bestranslate") == "translate"
+    assert infer_task("suggestranslate") == "translate"
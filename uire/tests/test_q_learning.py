@@ -0,0 +1,22 @@
+"""Tests for the Q-learning policy stub."""
+import pytest
+
+from uire.rl.q_learning import QPolicy
+
+def test_update_and_choose_action():
+    policy = QPolicy(alpha=0.5, gamma=0.9, epsilon=0.0, n_states=1)
+    # unseen states default to asking (action 0)
+    assert policy.choose_action((0,)) == 0
+    policy.update((0,), 1, 1.0, (1,))
+    assert policy.q[0, 1] == pytest.approx(0.5)
+    assert policy.choose_action((0,)) == 1
+    # bootstraps from the best action of the next state
+    policy.update((2,), 0, 0.0, (0,))
+    assert policy.q[2, 0] == pytest.approx(0.5 * 0.9 * 0.5)
+    # the table grows past its initial size
+    assert policy.q.shape[0] >= 3
+
+def test_update_rejects_invalid_action():
+    policy = QPolicy()
+    with pytest.raises(ValueError):
+        policy.update((0,), 2, 1.0, (1,))
@@ -0,0 +1,96 @@
+"""Tests for the SQLite preference store and its per-user cache.
+
+These check that cached reads never outlive a write made through
+``set``, ``set_many`` or ``clear_user``, including a write that lands
+while a read is between its SELECT and storing the result, or a TTL
+expiry, plus the client-ID hashing helper.
+"""
+import hashlib
+
+from uire.utils import storage
+from uire.utils.storage import PreferenceStore, hashed_id
+
+def _store(tmp_path):
+    return PreferenceStore(str(tmp_path / "prefs.db"))
+
+def test_read_after_set(tmp_path):
+    store = _store(tmp_path)
+    assert store.all_for_user("u") == {}
+    store.set("u", "region", "US")
+    assert store.all_for_user("u") == {"region": "US"}
+    store.set("u", "region", "EU")
+    assert store.all_for_user("u") == {"region": "EU"}
+
+def test_read_after_set_many(tmp_path):
+    store = _store(tmp_path)
+    store.set("u", "region", "US")
+    assert store.all_for_user("u") == {"region": "US"}
+    store.set_many("u", {"region": "EU", "language": "HI"})
+    assert store.all_for_user("u") == {"region": "EU", "language": "HI"}
+
+def test_read_after_clear_user(tmp_path):
+    store = _store(tmp_path)
+    store.set_many("u", {"region": "US", "language": "EN"})
+    assert store.all_for_user("u") == {"region": "US", "language": "EN"}
+    store.clear_user("u")
+    assert store.all_for_user("u") == {}
+
+def test_returned_prefs_are_copies(tmp_path):
+    store = _store(tmp_path)
+    store.set("u", "region", "US")
+    store.all_for_user("u")["region"] = "XX"
+    assert store.all_for_user("u") == {"region": "US"}
+
+def test_write_during_read_is_not_cached_stale(tmp_path):
+    store = _store(tmp_path)
+    store.set("u", "region", "US")
+    real_conn = store._conn
+
+    class _Cursor:
+        def __init__(self, cur):
+            self._cur = cur
+
+        def execute(self, *args):
+            return self._cur.execute(*args)
+
+        def fetchall(self):
+            rows = self._cur.fetchall()
+            # A concurrent request updates the prefs after the SELECT ran
+            store._conn = real_conn
+            store.set("u", "region", "EU")
+            return rows
+
+    class _Conn:
+        def cursor(self):
+            return _Cursor(real_conn().cursor())
+
+    store._conn = lambda: _Conn()
+    assert store.all_for_user("u") == {"region": "US"}
+    assert store.all_for_user("u") == {"region": "EU"}
+
+def test_expired_prefs_leave_cache_and_table(tmp_path, monkeypatch):
+    store = _store(tmp_path)
+    monkeypatch.setattr(storage, "now_ms", lambda: 1_000)
+    store.set("u", "region", "US", ttl_ms=500)
+    store.set("u", "language", "EN")
+    assert store.all_for_user("u") == {"region": "US", "language": "EN"}
+    # The cached read must not outlive the earliest expiry
+    monkeypatch.setattr(storage, "now_ms", lambda: 1_501)
+    assert store.all_for_user("u") == {"language": "EN"}
+    rows = store._conn().execute("SELECT key FROM preferences WHERE user_id=?", ("u",)).fetchall()
+    assert rows == [("language",)]
+
+def test_hashed_id_blake2b(monkeypatch):
+    monkeypatch.setattr(storage, "HASH_ALGO", "blake2b")
+    hid = hashed_id("127.0.0.1", salt="s")
+    assert len(hid) == 16 and int(hid, 16) >= 0
+    assert hid == hashed_id("127.0.0.1", salt="s")
+    assert hid != hashed_id("127.0.0.1", salt="t")
+    # salts longer than a BLAKE2b key must not be truncated into collisions
+    assert hashed_id("a", salt="s" * 64 + "A") != hashed_id("a", salt="s" * 64 + "B")
+
+def test_hashed_id_sha256_compat(monkeypatch):
+    monkeypatch.setattr(storage, "HASH_ALGO", "sha256")
+    expected = hashlib.sha256(b"127.0.0.1|s").hexdigest()[:16]
+    assert hashed_id("127.0.0.1", salt="s") == expected
+    assert hashed_id("127.0.0.1", salt="t") != expected
@@ -0,0 +1,45 @@
+"""Tests for the background JSONL event writer."""
+import json
+import time
+
+from uire.utils import telemetry
+
+def _read(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+def test_log_event_is_written_after_flush(tmp_path, monkeypatch):
+    log = tmp_path / "events.jsonl"
+    monkeypatch.setattr(telemetry, "LOG_PATH", str(log))
+    telemetry.log_event({"type": "ok1"})
+    telemetry.log_event({"type": "bad", "d": {1: "x"}, "o": object()})
+    telemetry.log_event({"type": "ok2"})
+    assert telemetry.export_jsonl() == str(log)
+    events = _read(log)
+    assert [e["type"] for e in events] == ["ok1", "bad", "ok2"]
+    assert events[1]["d"] == {"1": "x"}
+    assert all("ts" in e for e in events)
+
+def test_unserialisable_event_does_not_drop_batch(tmp_path, monkeypatch):
+    log = tmp_path / "events.jsonl"
+    monkeypatch.setattr(telemetry, "LOG_PATH", str(log))
+    telemetry.log_event({"type": "ok1"})
+    telemetry.log_event({"type": "bad", "n": 2 ** 70})  # too large for orjson
+    telemetry.log_event({"type": "ok2"})
+    assert telemetry.flush()
+    assert [e["type"] for e in _read(log)] == ["ok1", "ok2"]
+
+def test_unusable_log_path_keeps_writer_alive(tmp_path, monkeypatch):
+    unusable = tmp_path / "is_a_dir"
+    unusable.mkdir()
+    monkeypatch.setattr(telemetry, "LOG_PATH", str(unusable))
+    telemetry.log_event({"type": "lost"})
+    start = time.monotonic()
+    assert telemetry.flush(timeout=2.0)
+    assert time.monotonic() - start < 2.0
+    assert telemetry._writer_thread.is_alive()
+    # the writer reopens once the path is usable again
+    log = tmp_path / "events.jsonl"
+    monkeypatch.setattr(telemetry, "LOG_PATH", str(log))
+    telemetry.log_event({"type": "kept"})
+    assert telemetry.flush()
+    assert [e["type"] for e in _read(log)] == ["kept"]
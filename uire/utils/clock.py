@@ -0,0 +1,10 @@
+"""Shared wall-clock helper.
+
+Millisecond timestamps come from ``time.time_ns()`` so they are plain
+integers, with no float multiply or rounding in TTL comparisons.
+"""
+from __future__ import annotations
+import time
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
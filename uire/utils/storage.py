@@ -7,153 +7,210 @@ functions for generating hashed user identifiers with a salt.
 from __future__ import annotations
 import os
 import sqlite3
-import time
+import threading
+import functools
 import hashlib
-from typing import Optional, Dict
+import itertools
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+
+from uire.utils.clock import now_ms
 
 DEFAULT_DB_PATH = os.environ.get("UIRE_DB", "preferences.db")
 DEFAULT_SALT = os.environ.get("UIRE_SALT", "uire_salt")
+# "blake2b" (default) or "sha256" to keep IDs from older deployments stable
+HASH_ALGO = os.environ.get("UIRE_HASH_ALGO", "blake2b").lower()
+if HASH_ALGO not in ("blake2b", "sha256"):
+    # Falling back silently would change every client ID and orphan stored prefs
+    raise ValueError(f"UIRE_HASH_ALGO must be 'blake2b' or 'sha256', got {HASH_ALGO!r}")
+
+class _SQLiteStore:
+    """Base class holding one long-lived autocommit connection per thread.
+
+    Subclasses list their ``CREATE ... IF NOT EXISTS`` statements in
+    ``SCHEMA``; they are run once when the store is constructed.
+    """
+
+    SCHEMA: Tuple[str, ...] = ()
 
-class PreferenceStore:
     def __init__(self, db_path: str = DEFAULT_DB_PATH):
         self.db_path = db_path
+        self._local = threading.local()
         self._ensure_schema()
 
+    def _conn(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA temp_store=MEMORY")
+            self._local.con = con
+        return con
+
     def _ensure_schema(self) -> None:
-        con = sqlite3.connect(self.db_path)
-        try:
-            cur = con.cursor()
-            # preferences table with expiry and hashed key support
-            cur.execute(
-                """CREATE TABLE IF NOT EXISTS preferences (
-                    user_id TEXT NOT NULL,
-                    key TEXT NOT NULL,
-                    value TEXT,
-                    expires_at INTEGER,
-                    PRIMARY KEY(user_id, key)
-                );"""
-            )
-            # consent table
-            cur.execute(
-                """CREATE TABLE IF NOT EXISTS consent (
-                    user_id TEXT PRIMARY KEY,
-                    accepted INTEGER NOT NULL,
-                    ts INTEGER NOT NULL
-                );"""
-            )
-            con.commit()
-        finally:
-            con.close()
+        cur = self._conn().cursor()
+        for stmt in self.SCHEMA:
+            cur.execute(stmt)
+
+class PreferenceStore(_SQLiteStore):
+    # preferences table with expiry and hashed key support
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS preferences (
+            user_id TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT,
+            expires_at INTEGER,
+            PRIMARY KEY(user_id, key)
+        );""",
+    )
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, cache_ttl: float = 30.0, cache_size: int = 10_000):
+        # user_id -> (valid_until_ms, prefs); LRU order, invalidated on writes
+        self._cache: OrderedDict[str, Tuple[int, Dict[str, str]]] = OrderedDict()
+        self._cache_ttl = cache_ttl
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+        # user_id -> generation stamp bumped on every write.  A read only
+        # caches its result if the stamp is unchanged since it started, so a
+        # write racing with the SELECT cannot leave stale prefs cached.
+        # Evicted stamps raise _gen_floor, which stays above every earlier stamp.
+        self._gen: OrderedDict[str, int] = OrderedDict()
+        self._gen_counter = itertools.count(1)
+        self._gen_floor = 0
+        super().__init__(db_path)
 
-    def _now_ms(self) -> int:
-        return int(time.time() * 1000)
+    def _generation(self, user_id: str) -> int:
+        return self._gen.get(user_id, self._gen_floor)
+
+    def _invalidate(self, user_id: str) -> None:
+        with self._cache_lock:
+            self._cache.pop(user_id, None)
+            self._gen[user_id] = next(self._gen_counter)
+            self._gen.move_to_end(user_id)
+            while len(self._gen) > self._cache_size:
+                _, evicted = self._gen.popitem(last=False)
+                self._gen_floor = max(self._gen_floor, evicted)
 
     def set(self, user_id: str, key: str, value: str, ttl_ms: Optional[int] = None) -> None:
-        exp = None if ttl_ms is None else (self._now_ms() + ttl_ms)
-        con = sqlite3.connect(self.db_path)
+        exp = None if ttl_ms is None else (now_ms() + ttl_ms)
+        cur = self._conn().cursor()
+        cur.execute(
+            """INSERT INTO preferences(user_id,key,value,expires_at)
+                VALUES(?,?,?,?)
+                ON CONFLICT(user_id,key) DO UPDATE SET value=excluded.value, expires_at=excluded.expires_at""",
+            (user_id, key, value, exp),
+        )
+        self._invalidate(user_id)
+
+    def set_many(self, user_id: str, prefs: Dict[str, str], ttl_ms: Optional[int] = None) -> None:
+        """Upsert several preferences in a single transaction."""
+        if not prefs:
+            return
+        exp = None if ttl_ms is None else (now_ms() + ttl_ms)
+        con = self._conn()
+        cur = con.cursor()
+        cur.execute("BEGIN")
         try:
-            cur = con.cursor()
-            cur.execute(
+            cur.executemany(
                 """INSERT INTO preferences(user_id,key,value,expires_at)
                     VALUES(?,?,?,?)
                     ON CONFLICT(user_id,key) DO UPDATE SET value=excluded.value, expires_at=excluded.expires_at""",
-                (user_id, key, value, exp),
+                [(user_id, k, v, exp) for k, v in prefs.items()],
             )
-            con.commit()
-        finally:
-            con.close()
+        except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+        cur.execute("COMMIT")
+        self._invalidate(user_id)
 
     def get(self, user_id: str, key: str) -> Optional[str]:
-        con = sqlite3.connect(self.db_path)
-        try:
-            cur = con.cursor()
-            cur.execute("SELECT value, expires_at FROM preferences WHERE user_id=? AND key=?", (user_id, key))
-            row = cur.fetchone()
-            if not row:
-                return None
-            value, exp = row
-            if exp is not None and exp < self._now_ms():
-                cur.execute("DELETE FROM preferences WHERE user_id=? AND key=?", (user_id, key))
-                con.commit()
-                return None
-            return value
-        finally:
-            con.close()
+        cur = self._conn().cursor()
+        cur.execute("SELECT value, expires_at FROM preferences WHERE user_id=? AND key=?", (user_id, key))
+        row = cur.fetchone()
+        if not row:
+            return None
+        value, exp = row
+        if exp is not None and exp < now_ms():
+            cur.execute("DELETE FROM preferences WHERE user_id=? AND key=?", (user_id, key))
+            return None
+        return value
 
     def all_for_user(self, user_id: str) -> Dict[str, str]:
-        con = sqlite3.connect(self.db_path)
-        try:
-            cur = con.cursor()
-            cur.execute("SELECT key, value, expires_at FROM preferences WHERE user_id=?", (user_id,))
-            out = {}
-            stale = []
-            for k, v, exp in cur.fetchall():
-                if exp is not None and exp < self._now_ms():
-                    stale.append(k)
-                else:
-                    out[k] = v
-            for k in stale:
-                cur.execute("DELETE FROM preferences WHERE user_id=? AND key=?", (user_id, k))
-            con.commit()
-            return out
-        finally:
-            con.close()
+        now = now_ms()
+        with self._cache_lock:
+            hit = self._cache.get(user_id)
+            if hit is not None and now < hit[0]:
+                self._cache.move_to_end(user_id)
+                return dict(hit[1])
+            gen = self._generation(user_id)
+        cur = self._conn().cursor()
+        # Purge this user's expired prefs in one statement before reading
+        cur.execute(
+            "DELETE FROM preferences WHERE user_id=? AND expires_at IS NOT NULL AND expires_at < ?",
+            (user_id, now),
+        )
+        cur.execute("SELECT key, value, expires_at FROM preferences WHERE user_id=?", (user_id,))
+        out = {}
+        # Never cache past the earliest expiry among the returned prefs
+        valid_until = now + int(self._cache_ttl * 1000)
+        for k, v, exp in cur.fetchall():
+            out[k] = v
+            if exp is not None:
+                valid_until = min(valid_until, exp)
+        with self._cache_lock:
+            if self._generation(user_id) != gen:
+                return dict(out)
+            self._cache[user_id] = (valid_until, out)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return dict(out)
 
     def clear_user(self, user_id: str) -> None:
-        con = sqlite3.connect(self.db_path)
-        try:
-            cur = con.cursor()
-            cur.execute("DELETE FROM preferences WHERE user_id=?", (user_id,))
-            con.commit()
-        finally:
-            con.close()
+        cur = self._conn().cursor()
+        cur.execute("DELETE FROM preferences WHERE user_id=?", (user_id,))
+        self._invalidate(user_id)
 
-class ConsentStore:
-    def __init__(self, db_path: str = DEFAULT_DB_PATH):
-        self.db_path = db_path
-        self._ensure_schema()
-
-    def _ensure_schema(self) -> None:
-        con = sqlite3.connect(self.db_path)
-        try:
-            cur = con.cursor()
-            cur.execute(
-                """CREATE TABLE IF NOT EXISTS consent (
-                    user_id TEXT PRIMARY KEY,
-                    accepted INTEGER NOT NULL,
-                    ts INTEGER NOT NULL
-                );"""
-            )
-            con.commit()
-        finally:
-            con.close()
+class ConsentStore(_SQLiteStore):
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS consent (
+            user_id TEXT PRIMARY KEY,
+            accepted INTEGER NOT NULL,
+            ts INTEGER NOT NULL
+        );""",
+    )
 
     def set(self, user_id: str, accepted: bool) -> None:
-        ts = int(time.time() * 1000)
-        con = sqlite3.connect(self.db_path)
-        try:
-            cur = con.cursor()
-            cur.execute(
-                """INSERT INTO consent(user_id, accepted, ts)
-                    VALUES(?,?,?)
-                    ON CONFLICT(user_id) DO UPDATE SET accepted=excluded.accepted, ts=excluded.ts""",
-                (user_id, 1 if accepted else 0, ts),
-            )
-            con.commit()
-        finally:
-            con.close()
+        ts = now_ms()
+        cur = self._conn().cursor()
+        cur.execute(
+            """INSERT INTO consent(user_id, accepted, ts)
+                VALUES(?,?,?)
+                ON CONFLICT(user_id) DO UPDATE SET accepted=excluded.accepted, ts=excluded.ts""",
+            (user_id, 1 if accepted else 0, ts),
+        )
 
     def get(self, user_id: str) -> bool:
-        con = sqlite3.connect(self.db_path)
-        try:
-            cur = con.cursor()
-            cur.execute("SELECT accepted FROM consent WHERE user_id=?", (user_id,))
-            row = cur.fetchone()
-            return bool(row[0]) if row else False
-        finally:
-            con.close()
+        cur = self._conn().cursor()
+        cur.execute("SELECT accepted FROM consent WHERE user_id=?", (user_id,))
+        row = cur.fetchone()
+        return bool(row[0]) if row else False
 
 # Helper for hashed IDs
 
+@functools.lru_cache(maxsize=16)
+def _keyed_blake2b(salt: str):
+    # Keying costs a full compression block, so keep one pre-keyed state per salt
+    key = salt.encode()
+    if len(key) > 64:
+        # BLAKE2b keys are at most 64 bytes; derive one rather than truncate
+        key = hashlib.blake2b(key).digest()
+    return hashlib.blake2b(key=key, digest_size=8)
+
 def hashed_id(raw: str, salt: str = DEFAULT_SALT) -> str:
-    return hashlib.sha256(f"{raw}|{salt}".encode()).hexdigest()[:16]
+    if HASH_ALGO == "sha256":
+        return hashlib.sha256(f"{raw}|{salt}".encode()).hexdigest()[:16]
+    h = _keyed_blake2b(salt).copy()
+    h.update(raw.encode())
+    return h.hexdigest()
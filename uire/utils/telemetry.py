@@ -1,74 +1,165 @@
 """Telemetry and metrics utilities.
 
-Provides a simple JSONL event logger and in-memory counters, plus
-exposure of Prometheus-style metrics.
+Provides a simple JSONL event logger and Prometheus counters and a
+latency histogram (via ``prometheus_client``).  Events are queued and
+written by a background thread so request handlers never block on file
+I/O.
 """
 from __future__ import annotations
+import atexit
 import os
-import json
-import time
-from threading import Lock
-from typing import Dict, Any
+import queue
+from threading import Event, Lock, Thread
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+import orjson
+from prometheus_client import Counter, Histogram
+
+from uire.utils.clock import now_ms
 
 LOG_PATH = os.environ.get("UIRE_LOG", "logs/events.jsonl")
 os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
 
-_counters = {
-    "requests_total": 0,
-    "ambiguous_total": 0,
-    "clarifications_total": 0,
-    "resolved_total": 0,
-    "answer_total": 0,
-    "errors_total": 0,
-    "latency_ms_sum": 0.0,
-}
-_lock = Lock()
+# Counters keyed by their stats() name; exported as uire_<key>
+COUNTER_KEYS = (
+    "requests_total",
+    "ambiguous_total",
+    "clarifications_total",
+    "resolved_total",
+    "answer_total",
+    "errors_total",
+)
+_counters: Dict[str, Counter] = {k: Counter(f"uire_{k}", k.replace("_", " ")) for k in COUNTER_KEYS}
+_lock = Lock()  # only guards registering new counters
+
+_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+LATENCY = Histogram("uire_latency_ms", "Detect request latency in milliseconds", buckets=_LATENCY_BUCKETS)
+PROCESS_LATENCY = Histogram(
+    "uire_process_latency_ms",
+    "Whole /v1/process pipeline latency in milliseconds",
+    buckets=_LATENCY_BUCKETS,
+)
+
+def _sample(metric, suffix: str) -> float:
+    for family in metric.collect():
+        for sample in family.samples:
+            if sample.name == family.name + suffix:
+                return sample.value
+    return 0.0
+
+# Background JSONL writer
+
+_BATCH_SIZE = 50
+_FLUSH_TIMEOUT = 5.0
+# Holds event dicts, plus Event markers queued by flush()
+_log_queue: "queue.Queue[Union[Dict[str, Any], Event]]" = queue.Queue()
+
+def _encode(event: Dict[str, Any]) -> Optional[bytes]:
+    try:
+        return orjson.dumps(event, default=str, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+    except TypeError:
+        # Skip only the event that cannot be serialised, not its batch
+        return None
+
+def _close(f: Optional[BinaryIO]) -> None:
+    if f is not None:
+        try:
+            f.close()
+        except OSError:
+            pass
+
+def _write(f: Optional[BinaryIO], path: Optional[str], events: List[Dict[str, Any]]) -> Tuple[Optional[BinaryIO], Optional[str]]:
+    """Append events to LOG_PATH, (re)opening it as needed.
+
+    Returns the open handle and the path it refers to, or (None, None) after
+    a failure so the next batch reopens the file.
+    """
+    data = b"".join(line for line in map(_encode, events) if line is not None)
+    try:
+        if f is None or path != LOG_PATH:
+            _close(f)
+            f, path = None, LOG_PATH
+            f = open(path, "ab")
+        f.write(data)
+        f.flush()
+        return f, path
+    except OSError:
+        # Telemetry is best effort: drop this batch and reopen on the next one
+        _close(f)
+        return None, None
+
+def _writer() -> None:
+    f: Optional[BinaryIO] = None
+    path: Optional[str] = None
+    while True:
+        batch = [_log_queue.get()]
+        while len(batch) < _BATCH_SIZE:
+            try:
+                batch.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+        events = [e for e in batch if not isinstance(e, Event)]
+        if events:
+            f, path = _write(f, path, events)
+        # Markers are released only once everything queued before them is written
+        for e in batch:
+            if isinstance(e, Event):
+                e.set()
+
+_writer_thread = Thread(target=_writer, name="uire-telemetry-writer", daemon=True)
+_writer_thread.start()
+
+def flush(timeout: float = _FLUSH_TIMEOUT) -> bool:
+    """Wait until events logged before this call are written to LOG_PATH.
+
+    Returns False if the writer is gone or did not catch up within timeout.
+    """
+    if not _writer_thread.is_alive():
+        return False
+    done = Event()
+    _log_queue.put_nowait(done)
+    return done.wait(timeout)
+
+atexit.register(flush)
 
 # Log event to JSONL
 
 def log_event(event: Dict[str, Any]) -> None:
-    event["ts"] = int(time.time() * 1000)
-    with _lock:
-        with open(LOG_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    # Drop events rather than queue them forever if the writer has died
+    if _writer_thread.is_alive():
+        _log_queue.put_nowait({**event, "ts": now_ms()})
 
 # Increment counter
 
 def inc(key: str, amt: int = 1) -> None:
-    with _lock:
-        _counters[key] = _counters.get(key, 0) + amt
+    counter = _counters.get(key)
+    if counter is None:
+        with _lock:
+            counter = _counters.get(key)
+            if counter is None:
+                counter = _counters[key] = Counter(f"uire_{key}", key.replace("_", " "))
+    counter.inc(amt)
 
 # Add latency
 
 def add_latency(ms: float) -> None:
-    with _lock:
-        _counters["latency_ms_sum"] += ms
+    LATENCY.observe(ms)
+
+def add_process_latency(ms: float) -> None:
+    PROCESS_LATENCY.observe(ms)
 
 # Stats summary
 
 def stats() -> Dict[str, Any]:
-    with _lock:
-        counters = dict(_counters)
+    counters: Dict[str, Any] = {k: int(_sample(c, "_total")) for k, c in list(_counters.items())}
+    latency_sum = _sample(LATENCY, "_sum")
+    counters["latency_ms_sum"] = latency_sum
     total = counters.get("requests_total", 0) or 1
-    counters["avg_latency_ms"] = round(counters.get("latency_ms_sum", 0.0) / total, 2)
+    counters["avg_latency_ms"] = round(latency_sum / total, 2)
     return counters
 
 # Export path
 
 def export_jsonl() -> str:
+    flush()
     return LOG_PATH
-
-# Prometheus text exposition
-
-def prometheus_text() -> str:
-    s = stats()
-    lines = []
-    lines.append(f"uire_requests_total {s.get('requests_total',0)}")
-    lines.append(f"uire_ambiguous_total {s.get('ambiguous_total',0)}")
-    lines.append(f"uire_clarifications_total {s.get('clarifications_total',0)}")
-    lines.append(f"uire_resolved_total {s.get('resolved_total',0)}")
-    lines.append(f"uire_answer_total {s.get('answer_total',0)}")
-    lines.append(f"uire_errors_total {s.get('errors_total',0)}")
-    lines.append(f"uire_latency_ms_sum {s.get('latency_ms_sum',0.0)}")
-    lines.append(f"uire_avg_latency_ms {s.get('avg_latency_ms',0.0)}")
-    return "\n".join(lines) + "\n"